@@ -0,0 +1,234 @@
+import os
+import sys
+import csv
+from io import StringIO
+from datetime import datetime, timedelta
+
+# --- CONFIGURACIÓN ---
+# El historial se guarda en ficheros pequeños e inmutables ("shards"), uno por
+# ejecución del bot. No hay índice central: el propio directorio hace de
+# manifiesto, así que cada commit diario solo añade un fichero nuevo y dos
+# ejecuciones concurrentes nunca tocan el mismo fichero.
+DIRECTORIO_HISTORIAL = "historial"
+ARCHIVO_LEGACY = "historial_extendido.csv"
+# Los meses cerrados se compactan en un shard inmutable compactado_AAAA-MM.csv
+PREFIJO_COMPACTADO = "compactado_"
+FORMATO_FECHA = "%Y-%m-%d %H:%M:%S"
+
+CAMPOS_CSV = [
+    "fecha_consulta", "origen", "destino", "fecha_salida",
+    "hora_salida", "hora_llegada", "duracion_minutos",
+    "escalas", "aerolinea", "numero_vuelo", "clase", "asientos_disponibles",
+    "precio_total", "precio_base", "impuestos",
+    "aeropuertos_escala", "ruta_completa"
+]
+
+# --- MODO DELTA (SOLO CAMBIOS) ---
+# Una observación idéntica a la anterior del mismo vuelo no se guarda entera:
+# - En los shards diarios va a un fichero aparte (<shard>.ext.csv) con solo la
+#   fecha y la clave del vuelo: extiende el intervalo de la última observación.
+# - En el compactado cada fila es un intervalo: la primera consulta y, en
+#   "repeticiones", los segundos transcurridos entre cada repetición y la anterior.
+CLAVE_VUELO = ["origen", "destino", "fecha_salida", "numero_vuelo"]
+CAMPOS_SEGUIDOS = [c for c in CAMPOS_CSV if c not in CLAVE_VUELO + ["fecha_consulta"]]
+CAMPOS_EXTENSION = ["fecha_consulta"] + CLAVE_VUELO
+CAMPOS_COMPACTADO = CAMPOS_CSV + ["repeticiones"]
+SUFIJO_EXTENSIONES = ".ext.csv"
+
+# --- SHARDS ---
+def nombre_shard(momento=None):
+    momento = momento or datetime.now()
+    nombre = momento.strftime("%Y-%m-%d_%H%M%S")
+    run_id = os.environ.get("GITHUB_RUN_ID")
+    if run_id: nombre += f"_{run_id}"
+    return os.path.join(DIRECTORIO_HISTORIAL, f"{nombre}.csv")
+
+def escribir_filas(ruta_shard, filas, campos=CAMPOS_CSV):
+    os.makedirs(os.path.dirname(ruta_shard) or ".", exist_ok=True)
+    with open(ruta_shard, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=campos, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(filas)
+
+def ruta_extensiones(ruta_shard):
+    return ruta_shard[:-len(".csv")] + SUFIJO_EXTENSIONES
+
+def rutas_shards():
+    if not os.path.isdir(DIRECTORIO_HISTORIAL): return []
+    return [os.path.join(DIRECTORIO_HISTORIAL, f)
+            for f in sorted(os.listdir(DIRECTORIO_HISTORIAL)) if f.endswith(".csv")]
+
+def anadir_fila(ruta_shard, fila, campos=CAMPOS_CSV):
+    os.makedirs(os.path.dirname(ruta_shard) or ".", exist_ok=True)
+    existe = os.path.isfile(ruta_shard)
+    with open(ruta_shard, mode='a', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=campos)
+        if not existe: writer.writeheader()
+        writer.writerow(fila)
+
+def _periodo(ruta):
+    nombre = os.path.basename(ruta)
+    if nombre.startswith(PREFIJO_COMPACTADO): nombre = nombre[len(PREFIJO_COMPACTADO):]
+    return nombre[:7] # "AAAA-MM"
+
+def _leer_filas_crudas(rutas=None):
+    # Cada fila lleva el shard del que sale (_shard) para poder compactar por periodo
+    for ruta in rutas_shards() if rutas is None else rutas:
+        with open(ruta, mode='r', newline='', encoding='utf-8') as file:
+            for row in csv.DictReader(file):
+                row['_shard'] = os.path.basename(ruta)
+                yield row
+
+def clave_vuelo(fila):
+    return tuple(fila[c] for c in CLAVE_VUELO)
+
+def orden_serie(fila):
+    # Varios workers escriben en el mismo segundo: la clave del vuelo desempata
+    return (fila['fecha_consulta'],) + clave_vuelo(fila)
+
+def es_extension(fila):
+    return fila.get('precio_total', "") == ""
+
+def mismos_datos(fila_a, fila_b):
+    return all(str(fila_a[c]) == str(fila_b[c]) for c in CAMPOS_SEGUIDOS)
+
+def expandir_filas(filas):
+    # Convierte intervalos y extensiones en la serie punto a punto original
+    ultimo = {}
+    puntos = []
+    huerfanas = 0
+    for row in sorted(filas, key=orden_serie):
+        clave = clave_vuelo(row)
+        if es_extension(row):
+            base = ultimo.get(clave)
+            if base is None:
+                huerfanas += 1
+                continue
+            puntos.append({**base, "fecha_consulta": row['fecha_consulta'], "_shard": row.get('_shard', "")})
+            continue
+
+        punto = {c: row.get(c) or "" for c in CAMPOS_CSV}
+        punto['_shard'] = row.get('_shard', "")
+        ultimo[clave] = punto
+        puntos.append(punto)
+
+        momento = datetime.strptime(row['fecha_consulta'], FORMATO_FECHA)
+        for seg in filter(None, (row.get('repeticiones') or "").split(";")):
+            momento += timedelta(seconds=int(seg))
+            puntos.append({**punto, "fecha_consulta": momento.strftime(FORMATO_FECHA)})
+
+    if huerfanas:
+        print(f"⚠️ {huerfanas} extensiones sin observación base previa: se ignoran")
+    puntos.sort(key=orden_serie)
+    return puntos
+
+def leer_filas():
+    return expandir_filas(_leer_filas_crudas())
+
+def clave_salida(fila):
+    return (fila['origen'], fila['destino'], fila['fecha_salida'])
+
+def indexar_por_salida(filas):
+    # Historial agrupado por (origen, destino, fecha_salida), en orden cronológico
+    indice = {}
+    for row in filas: indice.setdefault(clave_salida(row), []).append(row)
+    return indice
+
+def csv_expandido():
+    buffer = StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=CAMPOS_CSV, extrasaction='ignore')
+    writer.writeheader()
+    writer.writerows(leer_filas())
+    buffer.seek(0)
+    return buffer
+
+# --- COMPACTACIÓN ---
+def compactar_filas(puntos):
+    intervalos = []
+    abierto = {}
+    for punto in puntos:
+        clave = clave_vuelo(punto)
+        intervalo = abierto.get(clave)
+        if intervalo is not None and mismos_datos(intervalo, punto):
+            anterior = datetime.strptime(intervalo['_ultima'], FORMATO_FECHA)
+            momento = datetime.strptime(punto['fecha_consulta'], FORMATO_FECHA)
+            intervalo['_repeticiones'].append(str(int((momento - anterior).total_seconds())))
+            intervalo['_ultima'] = punto['fecha_consulta']
+            continue
+
+        intervalo = {**punto, "_ultima": punto['fecha_consulta'], "_repeticiones": []}
+        abierto[clave] = intervalo
+        intervalos.append(intervalo)
+
+    for intervalo in intervalos:
+        del intervalo['_ultima']
+        intervalo['repeticiones'] = ";".join(intervalo.pop('_repeticiones'))
+    return intervalos
+
+def compactar(hoy=None):
+    # Solo se compactan meses ya cerrados; los shards del mes en curso no se tocan
+    mes_actual = (hoy or datetime.now()).strftime("%Y-%m")
+    rutas = rutas_shards()
+    periodos = sorted({
+        _periodo(r) for r in rutas
+        if not os.path.basename(r).startswith(PREFIJO_COMPACTADO) and _periodo(r) < mes_actual
+    })
+    if not periodos:
+        print("ℹ️ No hay meses cerrados pendientes de compactar.")
+        return 0
+
+    # Se expande todo el historial para que las extensiones encuentren su base
+    puntos = expandir_filas(_leer_filas_crudas(rutas))
+    for periodo in periodos:
+        origen = [r for r in rutas if _periodo(r) == periodo]
+        nombres = {os.path.basename(r) for r in origen}
+        intervalos = compactar_filas([p for p in puntos if p['_shard'] in nombres])
+
+        destino = os.path.join(DIRECTORIO_HISTORIAL, f"{PREFIJO_COMPACTADO}{periodo}.csv")
+        temporal = destino + ".tmp"
+        with open(temporal, mode='w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=CAMPOS_COMPACTADO, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(intervalos)
+
+        # Primero se publica el compactado: si algo falla después, los datos siguen ahí
+        os.replace(temporal, destino)
+        for ruta in origen:
+            if os.path.abspath(ruta) != os.path.abspath(destino): os.remove(ruta)
+        print(f"✅ {periodo}: {len(origen)} shards compactados en {len(intervalos)} intervalos ({destino})")
+    return len(periodos)
+
+# --- MIGRACIÓN DESDE EL CSV ÚNICO ---
+def migrar_legacy():
+    if not os.path.isfile(ARCHIVO_LEGACY):
+        print(f"ℹ️ No existe {ARCHIVO_LEGACY}, nada que migrar.")
+        return 0
+
+    por_dia = {}
+    with open(ARCHIVO_LEGACY, mode='r', newline='', encoding='utf-8') as file:
+        for row in csv.DictReader(file):
+            dia = (row.get('fecha_consulta') or "")[:10]
+            if not dia: continue
+            por_dia.setdefault(dia, []).append(row)
+
+    os.makedirs(DIRECTORIO_HISTORIAL, exist_ok=True)
+    for dia, filas in sorted(por_dia.items()):
+        ruta = os.path.join(DIRECTORIO_HISTORIAL, f"{dia}_legacy.csv")
+        with open(ruta, mode='w', newline='', encoding='utf-8') as file:
+            writer = csv.DictWriter(file, fieldnames=CAMPOS_CSV, extrasaction='ignore')
+            writer.writeheader()
+            writer.writerows(filas)
+
+    os.remove(ARCHIVO_LEGACY)
+    print(f"✅ {len(por_dia)} shards creados a partir de {ARCHIVO_LEGACY}")
+    return len(por_dia)
+
+if __name__ == "__main__":
+    comando = sys.argv[1] if len(sys.argv) > 1 else ""
+    if comando == "migrar":
+        migrar_legacy()
+    elif comando == "compactar":
+        compactar()
+    else:
+        print("Uso: python almacen_historial.py [migrar|compactar]")
+        sys.exit(1)
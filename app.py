@@ -6,6 +6,8 @@ import plotly.graph_objects as go
 from datetime import datetime
 import json
 from io import BytesIO
+import almacen_historial
+import metricas
 
 # --- CONFIGURACIÓN DE PÁGINA ---
 st.set_page_config(
@@ -19,6 +21,9 @@ st.set_page_config(
 PRECIO_OBJETIVO_DEFAULT = int(os.environ.get("PRECIO_OBJETIVO", 800))
 ASIENTOS_CRITICOS = 5
 
+# Tiempos de esta ejecución del script (panel de perfilado opcional)
+METRICAS = metricas.Registro()
+
 # --- CARGAR AEROPUERTOS ---
 @st.cache_data
 def cargar_aeropuertos():
@@ -54,9 +59,14 @@ def get_nombre_aerolinea(codigo):
 
 # --- CARGA DE DATOS ---
 @st.cache_data(ttl=300)
+@METRICAS.medir("cargar_datos")
 def cargar_datos():
+    rutas = almacen_historial.rutas_shards()
+    if not rutas:
+        return None
     try:
-        df = pd.read_csv("historial_extendido.csv")
+        # Expande los intervalos del modo delta a la serie punto a punto
+        df = pd.read_csv(almacen_historial.csv_expandido())
         df['fecha_consulta'] = pd.to_datetime(df['fecha_consulta'])
         df['fecha_salida'] = pd.to_datetime(df['fecha_salida'])
         df['nombre_aerolinea'] = df['aerolinea'].apply(get_nombre_aerolinea)
@@ -89,6 +99,7 @@ def calcular_score_vuelo(row):
     score_total = (precio_norm * 0.4 + duracion_norm * 0.3 + horario_score * 0.2 + asientos_score * 0.1)
     return round(score_total, 1)
 
+@METRICAS.medir("scoring_top_ofertas")
 def obtener_top_ofertas(df, n=3):
     if df.empty:
         return pd.DataFrame()
@@ -118,6 +129,7 @@ def predecir_tendencia(df, fecha_salida):
         return "➡️", cambio_pct, "Precio estable", prediccion
 
 # --- SISTEMA DE ALERTAS ---
+@METRICAS.medir("check_alertas")
 def check_alertas(df, config):
     alertas = []
     vuelos_alertados = df.copy()
@@ -144,6 +156,7 @@ def check_alertas(df, config):
     return alertas, vuelos_alertados
 
 # --- MAPA DE RUTAS ---
+@METRICAS.medir("grafico_mapa_rutas")
 def crear_mapa_rutas(df):
     fig = go.Figure()
     
@@ -251,6 +264,7 @@ def exportar_excel(df):
     return output
 
 # --- GRÁFICOS ---
+@METRICAS.medir("grafico_calendario")
 def plot_calendar_heatmap(df):
     df_cal = df.groupby('fecha_salida')['precio_total'].min().reset_index()
     df_cal['semana'] = df_cal['fecha_salida'].dt.isocalendar().week
@@ -292,6 +306,7 @@ def plot_calendar_heatmap(df):
     )
     return fig
 
+@METRICAS.medir("grafico_impuestos")
 def crear_grafico_impuestos(df):
     df_agg = df.groupby('nombre_aerolinea').agg({
         'precio_base': 'mean', 'impuestos': 'mean'
@@ -318,10 +333,12 @@ if df is None:
 # --- SIDEBAR ---
 with st.sidebar:
     st.markdown("### ⚙️ Configuración")
+    destino_sel = st.multiselect("Destino", df['destino'].unique(), default=df['destino'].unique())
     origen_sel = st.multiselect("Origen", df['origen'].unique(), default=df['origen'].unique())
     aerolinea_sel = st.multiselect("Aerolínea", df['nombre_aerolinea'].unique(), 
                                    default=df['nombre_aerolinea'].unique())
-    df_filtrado = df[(df['origen'].isin(origen_sel)) & (df['nombre_aerolinea'].isin(aerolinea_sel))]
+    df_filtrado = df[(df['destino'].isin(destino_sel)) & (df['origen'].isin(origen_sel)) &
+                     (df['nombre_aerolinea'].isin(aerolinea_sel))]
     
     st.markdown("---")
     st.markdown("### 🎯 Precio Objetivo")
@@ -355,6 +372,10 @@ with st.sidebar:
             mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
         )
     
+    st.markdown("---")
+    perfilado = st.checkbox("🧪 Perfilado", value=os.environ.get("PERFILADO") == "1",
+                            help="Muestra dónde se va el tiempo de esta ejecución")
+    
     st.markdown("---")
     st.caption("v4.0 Advanced Features")
 
@@ -438,16 +459,18 @@ with tab1:
     
     c1, c2 = st.columns(2)
     with c1:
-        df_dias = df_filtrado.groupby('fecha_salida')['precio_total'].min().reset_index()
-        fig_bar = px.bar(df_dias, x='fecha_salida', y='precio_total')
-        fig_bar.add_hline(y=precio_objetivo, line_dash="dash", line_color="red")
-        fig_bar.update_layout(template='plotly_white', paper_bgcolor='rgba(0,0,0,0)')
+        with METRICAS.cronometro("grafico_minimo_por_dia"):
+            df_dias = df_filtrado.groupby('fecha_salida')['precio_total'].min().reset_index()
+            fig_bar = px.bar(df_dias, x='fecha_salida', y='precio_total')
+            fig_bar.add_hline(y=precio_objetivo, line_dash="dash", line_color="red")
+            fig_bar.update_layout(template='plotly_white', paper_bgcolor='rgba(0,0,0,0)')
         st.plotly_chart(fig_bar, use_container_width=True)
     
     with c2:
-        fig_line = px.line(df_filtrado, x='fecha_consulta', y='precio_total', color='origen')
-        fig_line.add_hline(y=precio_objetivo, line_dash="dash", line_color="red")
-        fig_line.update_layout(template='plotly_white', paper_bgcolor='rgba(0,0,0,0)')
+        with METRICAS.cronometro("grafico_evolucion"):
+            fig_line = px.line(df_filtrado, x='fecha_consulta', y='precio_total', color='origen')
+            fig_line.add_hline(y=precio_objetivo, line_dash="dash", line_color="red")
+            fig_line.update_layout(template='plotly_white', paper_bgcolor='rgba(0,0,0,0)')
         st.plotly_chart(fig_line, use_container_width=True)
 
 # === TAB 2 ===
@@ -463,7 +486,8 @@ with tab3:
 # === TAB 4 ===
 with tab4:
     df_display = df_filtrado.copy()
-    df_display['score'] = df_display.apply(calcular_score_vuelo, axis=1)
+    with METRICAS.cronometro("scoring_tabla"):
+        df_display['score'] = df_display.apply(calcular_score_vuelo, axis=1)
     df_display['🎯'] = df_display['precio_total'] < precio_objetivo
     df_display['🎯'] = df_display['🎯'].map({True: '✅', False: '❌'})
     
@@ -513,3 +537,15 @@ with tab4:
             )
         }
     )
+
+# === PERFILADO ===
+if perfilado:
+    st.markdown("---")
+    st.markdown("### 🧪 Perfilado de esta ejecución")
+    resumen = METRICAS.resumen()
+    st.caption(f"Tiempo total del script: {resumen['duracion_s']:.3f} s • "
+               "cargar_datos solo aparece cuando no está en caché")
+    tabla = METRICAS.tabla()
+    if tabla:
+        st.dataframe(pd.DataFrame(tabla).sort_values("total_s", ascending=False),
+                     use_container_width=True, hide_index=True)
@@ -0,0 +1,98 @@
+import os
+import json
+import time
+from functools import wraps
+from contextlib import contextmanager
+from datetime import datetime
+
+# --- CONFIGURACIÓN ---
+DIRECTORIO_METRICAS = os.environ.get("METRICAS_DIR", "metricas")
+PREFIJO_PROMETHEUS = "bot_vuelos"
+PERCENTILES = [50, 90, 99]
+
+def _percentil(valores_ordenados, p):
+    # Método "nearest rank": siempre devuelve una muestra real
+    if not valores_ordenados: return 0.0
+    rango = max(1, -(-p * len(valores_ordenados) // 100))
+    return valores_ordenados[rango - 1]
+
+class Registro:
+    def __init__(self):
+        self.inicio = datetime.now()
+        self.tiempos = {}
+        self.contadores = {}
+
+    # --- TEMPORIZADORES ---
+    @contextmanager
+    def cronometro(self, nombre):
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.tiempos.setdefault(nombre, []).append(time.perf_counter() - t0)
+
+    def medir(self, nombre):
+        def decorador(func):
+            @wraps(func)
+            def envoltorio(*args, **kwargs):
+                with self.cronometro(nombre):
+                    return func(*args, **kwargs)
+            return envoltorio
+        return decorador
+
+    # --- CONTADORES ---
+    def contar(self, nombre, n=1):
+        self.contadores[nombre] = self.contadores.get(nombre, 0) + n
+
+    # --- INFORMES ---
+    def resumen(self):
+        tiempos = {}
+        for nombre, valores in self.tiempos.items():
+            ordenados = sorted(valores)
+            tiempos[nombre] = {
+                "llamadas": len(ordenados),
+                "total_s": round(sum(ordenados), 6),
+                **{f"p{p}_s": round(_percentil(ordenados, p), 6) for p in PERCENTILES},
+                "max_s": round(ordenados[-1], 6)
+            }
+        return {
+            "inicio": self.inicio.strftime("%Y-%m-%d %H:%M:%S"),
+            "duracion_s": round((datetime.now() - self.inicio).total_seconds(), 3),
+            "tiempos": tiempos,
+            "contadores": dict(self.contadores)
+        }
+
+    def tabla(self):
+        return [{"operacion": nombre, **datos} for nombre, datos in self.resumen()["tiempos"].items()]
+
+    def a_prometheus(self):
+        resumen = self.resumen()
+        lineas = [
+            f"# TYPE {PREFIJO_PROMETHEUS}_ejecucion_timestamp_segundos gauge",
+            f"{PREFIJO_PROMETHEUS}_ejecucion_timestamp_segundos {self.inicio.timestamp():.0f}",
+            f"# TYPE {PREFIJO_PROMETHEUS}_ejecucion_duracion_segundos gauge",
+            f"{PREFIJO_PROMETHEUS}_ejecucion_duracion_segundos {resumen['duracion_s']}"
+        ]
+        if resumen["tiempos"]:
+            metrica = f"{PREFIJO_PROMETHEUS}_operacion_segundos"
+            lineas.append(f"# TYPE {metrica} summary")
+            for nombre, datos in resumen["tiempos"].items():
+                for p in PERCENTILES:
+                    lineas.append(f'{metrica}{{operacion="{nombre}",quantile="{p / 100}"}} {datos[f"p{p}_s"]}')
+                lineas.append(f'{metrica}_sum{{operacion="{nombre}"}} {datos["total_s"]}')
+                lineas.append(f'{metrica}_count{{operacion="{nombre}"}} {datos["llamadas"]}')
+        for nombre, valor in resumen["contadores"].items():
+            metrica = f"{PREFIJO_PROMETHEUS}_{nombre}_total"
+            lineas.append(f"# TYPE {metrica} counter")
+            lineas.append(f"{metrica} {valor}")
+        return "\n".join(lineas) + "\n"
+
+    def guardar(self, nombre_ejecucion):
+        # Un JSON por ejecución (para ver tendencias) y el textfile de Prometheus
+        os.makedirs(DIRECTORIO_METRICAS, exist_ok=True)
+        ruta_json = os.path.join(DIRECTORIO_METRICAS, f"{nombre_ejecucion}.json")
+        with open(ruta_json, 'w', encoding='utf-8') as f:
+            json.dump(self.resumen(), f, indent=2, ensure_ascii=False)
+        with open(os.path.join(DIRECTORIO_METRICAS, f"{nombre_ejecucion}.prom"), 'w', encoding='utf-8') as f:
+            f.write(self.a_prometheus())
+        return ruta_json
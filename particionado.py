@@ -0,0 +1,13 @@
+# --- REPARTO DE LA REJILLA ENTRE WORKERS ---
+# Sin dependencias externas: lo usan el rastreador y los tests.
+
+def validar_particion(workers, worker):
+    if workers < 1:
+        raise ValueError(f"El número de workers debe ser >= 1 (recibido {workers})")
+    if not 0 <= worker < workers:
+        raise ValueError(f"El índice de worker debe estar entre 0 y {workers - 1} (recibido {worker})")
+
+def particionar(tareas, workers, worker):
+    # Reparto round-robin sobre el orden de la rejilla: determinista y equilibrado
+    validar_particion(workers, worker)
+    return [(orden, t) for orden, t in enumerate(tareas) if orden % workers == worker]
@@ -0,0 +1,101 @@
+import os
+import csv
+from datetime import datetime
+
+import pytest
+
+import almacen_historial
+
+def _sin_origen(puntos):
+    return [{k: v for k, v in p.items() if k != "_shard"} for p in puntos]
+
+def _fila(fecha_consulta, precio, origen="MAD", fecha_salida="2026-07-08"):
+    fila = {c: "" for c in almacen_historial.CAMPOS_CSV}
+    fila.update({
+        "fecha_consulta": fecha_consulta, "origen": origen, "destino": "DPS",
+        "fecha_salida": fecha_salida, "numero_vuelo": "EK144", "aerolinea": "EK",
+        "precio_total": precio, "precio_base": "500.0", "asientos_disponibles": "3"
+    })
+    return fila
+
+def _escribir(ruta, filas, campos):
+    with open(ruta, mode='w', newline='', encoding='utf-8') as file:
+        writer = csv.DictWriter(file, fieldnames=campos)
+        writer.writeheader()
+        writer.writerows(filas)
+
+@pytest.fixture
+def historial_tmp(tmp_path, monkeypatch):
+    monkeypatch.setattr(almacen_historial, "DIRECTORIO_HISTORIAL", str(tmp_path))
+    return tmp_path
+
+def test_compactar_y_expandir_reproduce_shards_de_varios_workers(historial_tmp):
+    # Dos ejecuciones fusionadas de varios workers: filas completas, extensiones
+    # y consultas que comparten segundo
+    salidas = [("MAD", "2026-07-08"), ("MAD", "2026-07-09"), ("BCN", "2026-07-08")]
+    _escribir(historial_tmp / "2026-05-01_080000.csv",
+              [_fila("2026-05-01 08:00:00", "900.0", origen=o, fecha_salida=f) for o, f in salidas],
+              almacen_historial.CAMPOS_CSV)
+    _escribir(historial_tmp / "2026-05-02_080000.csv",
+              [_fila("2026-05-02 08:00:00", "850.0", origen="BCN", fecha_salida="2026-07-08")],
+              almacen_historial.CAMPOS_CSV)
+    _escribir(historial_tmp / "2026-05-02_080000.ext.csv",
+              [{"fecha_consulta": "2026-05-02 08:00:00", "origen": o, "destino": "DPS",
+                "fecha_salida": f, "numero_vuelo": "EK144"} for o, f in salidas[:2]],
+              almacen_historial.CAMPOS_EXTENSION)
+    puntos = almacen_historial.leer_filas()
+    assert len(puntos) == 6
+
+    intervalos = almacen_historial.compactar_filas(puntos)
+    assert len(intervalos) == 4
+    assert _sin_origen(almacen_historial.expandir_filas(intervalos)) == _sin_origen(puntos)
+
+def test_expandir_aplica_extensiones_y_repeticiones():
+    filas = [
+        _fila("2026-01-01 08:00:00", "900.0"),
+        {"fecha_consulta": "2026-01-02 08:00:05", "origen": "MAD", "destino": "DPS",
+         "fecha_salida": "2026-07-08", "numero_vuelo": "EK144"},
+        _fila("2026-01-03 08:00:00", "850.0"),
+    ]
+    puntos = almacen_historial.expandir_filas(filas)
+    assert [p["fecha_consulta"] for p in puntos] == [
+        "2026-01-01 08:00:00", "2026-01-02 08:00:05", "2026-01-03 08:00:00"]
+    assert [p["precio_total"] for p in puntos] == ["900.0", "900.0", "850.0"]
+
+    intervalos = almacen_historial.compactar_filas(puntos)
+    assert [i["repeticiones"] for i in intervalos] == ["86405", ""]
+    assert _sin_origen(almacen_historial.expandir_filas(intervalos)) == _sin_origen(puntos)
+
+def test_orden_determinista_con_consultas_en_el_mismo_segundo():
+    # Filas de varios workers con la misma fecha_consulta, en orden arbitrario
+    filas = [_fila("2026-01-01 08:00:00", "900.0", origen=o, fecha_salida=f)
+             for o, f in [("MAD", "2026-07-09"), ("BCN", "2026-07-08"), ("MAD", "2026-07-08")]]
+    filas += [_fila("2026-01-02 08:00:00", "900.0", origen=o, fecha_salida=f)
+              for o, f in [("MAD", "2026-07-08"), ("MAD", "2026-07-09"), ("BCN", "2026-07-08")]]
+    puntos = almacen_historial.expandir_filas(filas)
+    assert puntos == sorted(puntos, key=almacen_historial.orden_serie)
+
+    intervalos = almacen_historial.compactar_filas(puntos)
+    assert _sin_origen(almacen_historial.expandir_filas(reversed(intervalos))) == _sin_origen(puntos)
+
+def test_compactar_solo_meses_cerrados(historial_tmp):
+    _escribir(historial_tmp / "2026-05-01_080000.csv",
+              [_fila("2026-05-01 08:00:00", "900.0")], almacen_historial.CAMPOS_CSV)
+    _escribir(historial_tmp / "2026-05-02_080000.ext.csv",
+              [{"fecha_consulta": "2026-05-02 08:00:00", "origen": "MAD", "destino": "DPS",
+                "fecha_salida": "2026-07-08", "numero_vuelo": "EK144"}],
+              almacen_historial.CAMPOS_EXTENSION)
+    # Extensión del mes en curso cuya base está en el mes que se compacta
+    _escribir(historial_tmp / "2026-06-01_080000.ext.csv",
+              [{"fecha_consulta": "2026-06-01 08:00:00", "origen": "MAD", "destino": "DPS",
+                "fecha_salida": "2026-07-08", "numero_vuelo": "EK144"}],
+              almacen_historial.CAMPOS_EXTENSION)
+    antes = _sin_origen(almacen_historial.leer_filas())
+
+    assert almacen_historial.compactar(hoy=datetime(2026, 6, 15)) == 1
+    assert sorted(os.listdir(historial_tmp)) == ["2026-06-01_080000.ext.csv", "compactado_2026-05.csv"]
+    assert _sin_origen(almacen_historial.leer_filas()) == antes
+    assert len(antes) == 3
+
+    # Sin meses cerrados pendientes no se reescribe nada
+    assert almacen_historial.compactar(hoy=datetime(2026, 6, 15)) == 0
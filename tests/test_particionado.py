@@ -0,0 +1,24 @@
+import pytest
+
+from particionado import particionar
+
+TAREAS = [(o, d, f"2026-07-{dia:02d}") for o, d in [("MAD", "DPS"), ("BCN", "DPS"), ("MAD", "BKK")]
+          for dia in range(8, 13)]
+
+@pytest.mark.parametrize("workers", [1, 2, 3, 4, 7, 20])
+def test_particiones_cubren_la_rejilla_sin_solaparse(workers):
+    particiones = [particionar(TAREAS, workers, k) for k in range(workers)]
+    ordenes = sorted(orden for p in particiones for orden, _ in p)
+    assert ordenes == list(range(len(TAREAS)))
+    assert all(TAREAS[orden] == tarea for p in particiones for orden, tarea in p)
+
+    tamanos = [len(p) for p in particiones]
+    assert max(tamanos) - min(tamanos) <= 1
+
+def test_particion_determinista():
+    assert particionar(TAREAS, 3, 1) == particionar(list(TAREAS), 3, 1)
+
+@pytest.mark.parametrize("workers, worker", [(0, 0), (-1, 0), (2, 2), (2, -1)])
+def test_argumentos_invalidos(workers, worker):
+    with pytest.raises(ValueError):
+        particionar(TAREAS, workers, worker)
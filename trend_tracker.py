@@ -3,9 +3,15 @@ import sys
 import io
 import re
 import csv
+import json
+import argparse
 import requests
+from multiprocessing import Pool
 from datetime import datetime, timedelta
-from amadeus import Client, ResponseError
+from amadeus import Client
+import almacen_historial
+import metricas
+from particionado import particionar, validar_particion
 
 # --- CONFIGURACIÓN DESDE VARIABLES DE ENTORNO ---
 API_KEY = os.environ.get("AMADEUS_API_KEY")
@@ -13,9 +19,14 @@ API_SECRET = os.environ.get("AMADEUS_API_SECRET")
 TELEGRAM_TOKEN = os.environ.get("TELEGRAM_TOKEN")
 TELEGRAM_CHAT_ID = os.environ.get("TELEGRAM_CHAT_ID")
 
+# Rutas por defecto si no existe el fichero de rutas
 ORIGENES = ["MAD", "BCN"]
 DESTINO = "DPS"
-ARCHIVO_HISTORIAL = "historial_extendido.csv"
+ARCHIVO_RUTAS = os.environ.get("ARCHIVO_RUTAS", "rutas.json")
+# Cada worker deja aquí su partición; el paso de fusión las une al historial
+DIRECTORIO_PARTICIONES = os.environ.get("PARTICIONES_DIR", "particiones")
+# "completo" guarda todas las filas; "delta" solo las que cambian
+MODO_HISTORIAL = os.environ.get("MODO_HISTORIAL", "completo")
 
 # FECHAS Y FILTROS
 FECHA_INICIO_BUSQUEDA = "2026-07-08" 
@@ -25,13 +36,10 @@ MAX_HORAS = 20.0
 PRECIO_MAXIMO = 1100
 PRECIO_OBJETIVO = int(os.environ.get("PRECIO_OBJETIVO", 800))
 
-CAMPOS_CSV = [
-    "fecha_consulta", "origen", "destino", "fecha_salida",
-    "hora_salida", "hora_llegada", "duracion_minutos",
-    "escalas", "aerolinea", "numero_vuelo", "clase", "asientos_disponibles",
-    "precio_total", "precio_base", "impuestos",
-    "aeropuertos_escala", "ruta_completa"
-]
+# Tiempos y contadores de esta ejecución
+METRICAS = metricas.Registro()
+
+CAMPOS_CSV = almacen_historial.CAMPOS_CSV
 
 def _parse_duracion(dur_str):
     h = int(m.group(1)) if (m := re.search(r'(\d+)H', dur_str)) else 0
@@ -43,10 +51,18 @@ def enviar_telegram(mensaje):
     url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
     payload = {"chat_id": TELEGRAM_CHAT_ID, "text": mensaje, "parse_mode": "HTML"}
     try:
-        requests.post(url, data=payload)
+        with METRICAS.cronometro("telegram"):
+            resp = requests.post(url, data=payload)
+        if resp.ok:
+            METRICAS.contar("telegram_enviados")
+        else:
+            METRICAS.contar("telegram_errores")
+            print(f"Error Telegram: HTTP {resp.status_code} {resp.text[:200]}")
     except Exception as e:
+        METRICAS.contar("telegram_errores")
         print(f"Error Telegram: {e}")
 
+@METRICAS.medir("analizar_vuelo")
 def analizar_vuelo(vuelo):
     itinerario = vuelo['itineraries'][0]
     segmentos = itinerario['segments']
@@ -94,18 +110,21 @@ def analizar_vuelo(vuelo):
         "clase": clase, "asientos": asientos_quedan
     }
 
-def gestionar_historial(origen, datos_vuelo, fecha_salida):
-    existe = os.path.isfile(ARCHIVO_HISTORIAL)
+def cargar_historial():
+    # Se lee y se indexa una sola vez por worker, no en cada búsqueda
+    with METRICAS.cronometro("historial_lectura"):
+        return almacen_historial.indexar_por_salida(almacen_historial.leer_filas())
+
+def gestionar_historial(origen, datos_vuelo, fecha_salida, destino, historial, ruta_salida):
     precio_actual = datos_vuelo['precio_total']
     registros_previos = []
+    ultima_fila = None
 
-    if existe:
-        with open(ARCHIVO_HISTORIAL, mode='r', newline='', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                if row['fecha_salida'] == fecha_salida and row['origen'] == origen:
-                    try: registros_previos.append(float(row['precio_total']))
-                    except: pass # Ignorar filas corruptas antiguas
+    previas = historial.setdefault((origen, destino, fecha_salida), [])
+    for row in previas:
+        try: registros_previos.append(float(row['precio_total']))
+        except: pass # Ignorar filas corruptas antiguas
+        if row['numero_vuelo'] == datos_vuelo['num_vuelo']: ultima_fila = row
 
     if not registros_previos: estado = "🆕 NUEVO"; diferencia = 0
     else:
@@ -115,97 +134,225 @@ def gestionar_historial(origen, datos_vuelo, fecha_salida):
         elif diferencia > 5: estado = "📈 SUBIDA"
         else: estado = "➖ IGUAL"
 
-    with open(ARCHIVO_HISTORIAL, mode='a', newline='', encoding='utf-8') as file:
-        writer = csv.DictWriter(file, fieldnames=CAMPOS_CSV)
-        if not existe: writer.writeheader()
-        
-        fila = {
-            "fecha_consulta": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            "origen": origen, "destino": DESTINO, "fecha_salida": fecha_salida,
-            "hora_salida": datos_vuelo['salida_iso'].split("T")[1],
-            "hora_llegada": datos_vuelo['llegada_iso'].split("T")[1],
-            "duracion_minutos": datos_vuelo['duracion_min'],
-            "escalas": datos_vuelo['escalas'],
-            "aerolinea": datos_vuelo['aerolinea'],
-            "numero_vuelo": datos_vuelo['num_vuelo'],
-            "clase": datos_vuelo['clase'],
-            "asientos_disponibles": datos_vuelo['asientos'],
-            "precio_total": datos_vuelo['precio_total'],
-            "precio_base": datos_vuelo['precio_base'],
-            "impuestos": datos_vuelo['impuestos'],
-            "aeropuertos_escala": datos_vuelo['aeropuertos_escala'],
-            "ruta_completa": datos_vuelo['ruta_completa']
-        }
-        writer.writerow(fila)
+    fila = {
+        "fecha_consulta": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        "origen": origen, "destino": destino, "fecha_salida": fecha_salida,
+        "hora_salida": datos_vuelo['salida_iso'].split("T")[1],
+        "hora_llegada": datos_vuelo['llegada_iso'].split("T")[1],
+        "duracion_minutos": datos_vuelo['duracion_min'],
+        "escalas": datos_vuelo['escalas'],
+        "aerolinea": datos_vuelo['aerolinea'],
+        "numero_vuelo": datos_vuelo['num_vuelo'],
+        "clase": datos_vuelo['clase'],
+        "asientos_disponibles": datos_vuelo['asientos'],
+        "precio_total": datos_vuelo['precio_total'],
+        "precio_base": datos_vuelo['precio_base'],
+        "impuestos": datos_vuelo['impuestos'],
+        "aeropuertos_escala": datos_vuelo['aeropuertos_escala'],
+        "ruta_completa": datos_vuelo['ruta_completa']
+    }
+
+    with METRICAS.cronometro("historial_escritura"):
+        if MODO_HISTORIAL == "delta" and ultima_fila and almacen_historial.mismos_datos(ultima_fila, fila):
+            # Sin cambios: solo se extiende el intervalo de la última observación
+            extension = {c: fila[c] for c in almacen_historial.CAMPOS_EXTENSION}
+            almacen_historial.anadir_fila(almacen_historial.ruta_extensiones(ruta_salida),
+                                          extension, almacen_historial.CAMPOS_EXTENSION)
+            METRICAS.contar("filas_extendidas")
+        else:
+            almacen_historial.anadir_fila(ruta_salida, fila)
+    METRICAS.contar("filas_escritas")
+    previas.append({k: str(v) for k, v in fila.items()})
 
     return estado, diferencia
 
+# --- RUTAS Y PARTICIONADO ---
+def cargar_rutas():
+    try:
+        with open(ARCHIVO_RUTAS, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        return [(o, d['destino']) for d in config['destinos'] for o in d['origenes']]
+    except FileNotFoundError:
+        return [(o, DESTINO) for o in ORIGENES]
+
+def generar_tareas(rutas):
+    fecha_base = datetime.strptime(FECHA_INICIO_BUSQUEDA, "%Y-%m-%d")
+    return [
+        (origen, destino, (fecha_base + timedelta(days=i)).strftime("%Y-%m-%d"))
+        for origen, destino in rutas for i in range(DIAS_A_ESCANEAR)
+    ]
+
+def _ruta_particion(worker, workers, extension):
+    return os.path.join(DIRECTORIO_PARTICIONES, f"worker-{worker}-de-{workers}.{extension}")
+
+# --- ESCANEO ---
+def escanear(amadeus, historial, ruta_salida, origen, destino, str_ida):
+    fecha_vuelta = datetime.strptime(str_ida, "%Y-%m-%d") + timedelta(days=DIAS_ESTANCIA)
+    str_vuelta = fecha_vuelta.strftime("%Y-%m-%d")
+
+    METRICAS.contar("amadeus_llamadas")
+    try:
+        with METRICAS.cronometro("amadeus_busqueda"):
+            res = amadeus.shopping.flight_offers_search.get(
+                originLocationCode=origen, destinationLocationCode=destino,
+                departureDate=str_ida, returnDate=str_vuelta,
+                adults=1, max=10, currencyCode='EUR'
+            )
+    except Exception:
+        # Cualquier fallo de la llamada (ResponseError, red, timeout...) es un error de API
+        METRICAS.contar("amadeus_errores")
+        raise
+
+    if not res.data:
+        METRICAS.contar("busquedas_sin_resultados")
+        return None
+
+    # Buscar mejor opción
+    mejor_vuelo = None
+    for v in res.data:
+        dur = _parse_duracion(v['itineraries'][0]['duration'])
+        precio = float(v['price']['total'])
+
+        if dur <= MAX_HORAS and precio <= PRECIO_MAXIMO:
+            mejor_vuelo = v
+            break
+
+    if not mejor_vuelo: return None
+
+    datos = analizar_vuelo(mejor_vuelo)
+    estado, dif = gestionar_historial(origen, datos, str_ida, destino, historial, ruta_salida)
+    print(f"✅ {str_ida} ({origen}→{destino}): {datos['precio_total']}€")
+
+    # Solo interesa notificar novedades, bajadas o precios bajo objetivo
+    bajo_target = datos['precio_total'] < PRECIO_OBJETIVO
+    if estado not in ["🆕 NUEVO", "📉 BAJADA"] and not bajo_target: return None
+    return {
+        "origen": origen, "destino": destino,
+        "fecha_ida": str_ida, "fecha_vuelta": str_vuelta,
+        "precio_total": datos['precio_total'], "duracion_min": datos['duracion_min'],
+        "estado": estado, "bajo_target": bajo_target
+    }
+
+def ejecutar_worker(worker, workers, guardar_metricas=True):
+    ruta_salida = _ruta_particion(worker, workers, "csv")
+    for resto in [ruta_salida, almacen_historial.ruta_extensiones(ruta_salida)]:
+        if os.path.isfile(resto): os.remove(resto) # Restos de una ejecución fallida
+    tareas = particionar(generar_tareas(cargar_rutas()), workers, worker)
+
+    historial = cargar_historial()
+    amadeus = Client(client_id=API_KEY, client_secret=API_SECRET)
+    print(f"📊 Worker {worker + 1}/{workers}: {len(tareas)} búsquedas...")
+
+    novedades = []
+    for orden, (origen, destino, str_ida) in tareas:
+        try:
+            novedad = escanear(amadeus, historial, ruta_salida, origen, destino, str_ida)
+            if novedad: novedades.append({"orden": orden, **novedad})
+        except Exception as e:
+            METRICAS.contar("errores")
+            print(f"Error {str_ida} ({origen}→{destino}): {e}")
+
+    os.makedirs(DIRECTORIO_PARTICIONES, exist_ok=True)
+    with open(_ruta_particion(worker, workers, "json"), 'w', encoding='utf-8') as f:
+        json.dump(novedades, f, ensure_ascii=False, indent=2)
+
+    if guardar_metricas:
+        nombre = datetime.now().strftime("%Y-%m-%d_%H%M%S")
+        METRICAS.guardar(f"{nombre}_worker-{worker}-de-{workers}")
+
+# --- FUSIÓN ---
+def construir_reporte(novedades, destinos):
+    titulo = "BALI" if destinos == {"DPS"} else "VUELOS"
+    reporte = f"✈️ <b>REPORTE {titulo}</b>\n"
+    for n in sorted(novedades, key=lambda n: n['orden']):
+        icono = "🚨" if n['bajo_target'] else ("🟢" if n['estado'] == "📉 BAJADA" else "🔵")
+        dur_h = n['duracion_min'] / 60
+        ruta = n['origen'] if len(destinos) == 1 else f"{n['origen']}→{n['destino']}"
+
+        reporte += f"\n{icono} <b>{ruta} ({n['fecha_ida']})</b>"
+        reporte += f"\n💰 {n['precio_total']}€ ({dur_h:.1f}h)"
+
+        fi = n['fecha_ida'].replace("-", "")[2:]
+        fv = n['fecha_vuelta'].replace("-", "")[2:]
+        link = f"https://www.skyscanner.es/transporte/vuelos/{n['origen']}/{n['destino']}/{fi}/{fv}/"
+        reporte += f"\n<a href='{link}'>Ver oferta</a>\n"
+    return reporte
+
+def fusionar():
+    if not os.path.isdir(DIRECTORIO_PARTICIONES):
+        print("ℹ️ No hay particiones que fusionar.")
+        return
+
+    archivos = sorted(os.listdir(DIRECTORIO_PARTICIONES))
+    filas, novedades = [], []
+    with METRICAS.cronometro("fusion_lectura"):
+        for nombre in archivos:
+            ruta = os.path.join(DIRECTORIO_PARTICIONES, nombre)
+            if nombre.endswith(".csv"):
+                with open(ruta, mode='r', newline='', encoding='utf-8') as file:
+                    filas.extend(csv.DictReader(file))
+            elif nombre.endswith(".json"):
+                with open(ruta, 'r', encoding='utf-8') as f:
+                    novedades.extend(json.load(f))
+
+    ruta_shard = almacen_historial.nombre_shard()
+    if filas:
+        guardadas = []
+        with METRICAS.cronometro("fusion_escritura"):
+            filas.sort(key=almacen_historial.orden_serie)
+            completas = [f for f in filas if not almacen_historial.es_extension(f)]
+            extensiones = [f for f in filas if almacen_historial.es_extension(f)]
+            # En modo delta puede que solo haya extensiones (<shard>.ext.csv)
+            if completas:
+                almacen_historial.escribir_filas(ruta_shard, completas)
+                guardadas.append(f"{len(completas)} completas en {ruta_shard}")
+            if extensiones:
+                ruta_ext = almacen_historial.ruta_extensiones(ruta_shard)
+                almacen_historial.escribir_filas(ruta_ext, extensiones, almacen_historial.CAMPOS_EXTENSION)
+                guardadas.append(f"{len(extensiones)} extensiones en {ruta_ext}")
+        METRICAS.contar("filas_fusionadas", len(filas))
+        print(f"💾 {len(filas)} filas de {len(archivos)} ficheros guardadas: {', '.join(guardadas)}")
+
+    if novedades:
+        destinos = {d for _, d in cargar_rutas()} | {n['destino'] for n in novedades}
+        enviar_telegram(construir_reporte(novedades, destinos))
+
+    for nombre in archivos: os.remove(os.path.join(DIRECTORIO_PARTICIONES, nombre))
+    ruta_metricas = METRICAS.guardar(os.path.splitext(os.path.basename(ruta_shard))[0])
+    print(f"⏱️ Métricas guardadas en {ruta_metricas}")
+
 def main():
+    parser = argparse.ArgumentParser(description="Rastreador de precios de vuelos")
+    parser.add_argument("--worker", type=int, help="Índice de este worker (0..N-1); solo escanea su partición")
+    parser.add_argument("--workers", type=int, default=1, help="Número total de workers")
+    parser.add_argument("--procesos", type=int, default=1, help="Lanza N workers locales en paralelo y fusiona")
+    parser.add_argument("--fusionar", action="store_true", help="Une las particiones al historial y notifica")
+    args = parser.parse_args()
+
+    try:
+        if args.worker is not None: validar_particion(args.workers, args.worker)
+        if args.procesos < 1: raise ValueError(f"--procesos debe ser >= 1 (recibido {args.procesos})")
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.fusionar:
+        fusionar()
+        return
+
     if not API_KEY or not API_SECRET:
         print("❌ Error: Faltan claves API.")
         return
 
-    if not os.path.isfile(ARCHIVO_HISTORIAL):
-        with open(ARCHIVO_HISTORIAL, mode='w', newline='', encoding='utf-8') as f:
-            csv.DictWriter(f, fieldnames=CAMPOS_CSV).writeheader()
+    if args.worker is not None:
+        ejecutar_worker(args.worker, args.workers)
+        return
 
-    amadeus = Client(client_id=API_KEY, client_secret=API_SECRET)
-    print(f"📊 Buscando vuelos a {DESTINO}...")
-    
-    fecha_base = datetime.strptime(FECHA_INICIO_BUSQUEDA, "%Y-%m-%d")
-    reporte = f"✈️ <b>REPORTE BALI</b>\n"
-    novedades = False
-
-    for origen in ORIGENES:
-        for i in range(DIAS_A_ESCANEAR):
-            fecha_ida = fecha_base + timedelta(days=i)
-            fecha_vuelta = fecha_ida + timedelta(days=DIAS_ESTANCIA)
-            str_ida = fecha_ida.strftime("%Y-%m-%d")
-            str_vuelta = fecha_vuelta.strftime("%Y-%m-%d")
-
-            try:
-                res = amadeus.shopping.flight_offers_search.get(
-                    originLocationCode=origen, destinationLocationCode=DESTINO,
-                    departureDate=str_ida, returnDate=str_vuelta,
-                    adults=1, max=10, currencyCode='EUR'
-                )
-
-                if not res.data: continue
-                
-                # Buscar mejor opción
-                mejor_vuelo = None
-                for v in res.data:
-                    dur = _parse_duracion(v['itineraries'][0]['duration'])
-                    precio = float(v['price']['total'])
-                    
-                    if dur <= MAX_HORAS and precio <= PRECIO_MAXIMO:
-                        mejor_vuelo = v
-                        break
-                
-                if mejor_vuelo:
-                    datos = analizar_vuelo(mejor_vuelo)
-                    estado, dif = gestionar_historial(origen, datos, str_ida)
-                    print(f"✅ {str_ida} ({origen}): {datos['precio_total']}€")
-
-                    # Notificación
-                    bajo_target = datos['precio_total'] < PRECIO_OBJETIVO
-                    if estado in ["🆕 NUEVO", "📉 BAJADA"] or bajo_target:
-                        novedades = True
-                        icono = "🚨" if bajo_target else ("🟢" if estado == "📉 BAJADA" else "🔵")
-                        dur_h = datos['duracion_min'] / 60
-                        
-                        reporte += f"\n{icono} <b>{origen} ({str_ida})</b>"
-                        reporte += f"\n💰 {datos['precio_total']}€ ({dur_h:.1f}h)"
-                        
-                        fi = str_ida.replace("-", "")[2:]
-                        fv = str_vuelta.replace("-", "")[2:]
-                        link = f"https://www.skyscanner.es/transporte/vuelos/{origen}/{DESTINO}/{fi}/{fv}/"
-                        reporte += f"\n<a href='{link}'>Ver oferta</a>\n"
-
-            except Exception as e:
-                print(f"Error {str_ida}: {e}")
-
-    if novedades: enviar_telegram(reporte)
+    if args.procesos > 1:
+        with Pool(args.procesos) as pool:
+            pool.starmap(ejecutar_worker, [(k, args.procesos) for k in range(args.procesos)])
+    else:
+        ejecutar_worker(0, 1, guardar_metricas=False)
+    fusionar()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file